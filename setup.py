@@ -7,6 +7,7 @@ setup(
     install_requires=[
         'spotipy',
         'python-dotenv',
+        'orjson',
     ],
     entry_points={
         'console_scripts': [
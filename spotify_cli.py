@@ -1,55 +1,258 @@
 #!/usr/bin/env python3
 """
 Spotify CLI - A command-line interface for Spotify
-Requires: pip install spotipy python-dotenv
+Requires: pip install spotipy python-dotenv orjson
 """
 
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
 import os
-from dotenv import load_dotenv
+import time
 import sys
 import argparse
-import webbrowser
 from typing import Optional
 
-# Load environment variables
-# Try to load from current directory first, then from home directory
-if os.path.exists('.env'):
-    load_dotenv()
-else:
-    load_dotenv(os.path.join(os.path.expanduser('~'), '.spotify-cli.env'))
+# spotipy, requests, orjson, dotenv, webbrowser, json, tempfile and threading are
+# imported lazily where they are needed so that `--help` and argument errors
+# don't pay their import cost.
+
+# Config and cache files live in the home directory so the CLI works from anywhere
+HOME = os.path.expanduser('~')
+ENV_PATH = os.path.join(HOME, '.spotify-cli.env')
+CACHE_PATH = os.path.join(HOME, '.spotify-cli-cache')
+TOKEN_PATH = os.path.join(HOME, '.spotify-cli-token.json')
+
+SCOPE = ('user-read-playback-state user-modify-playback-state user-read-currently-playing '
+         'playlist-read-private playlist-modify-private playlist-modify-public '
+         'user-library-read user-library-modify user-top-read')
+
+_NO_DEVICE_MSG = (
+    "❌ No Spotify devices found!\n"
+    "\n💡 To use Spotify CLI, you need to:\n"
+    "   1. Open Spotify Desktop App, or\n"
+    "   2. Open Spotify on your phone, or\n"
+    "   3. Open Spotify Web Player\n"
+)
+
+_MISSING_CREDENTIALS_MSG = (
+    "❌ Error: Spotify credentials not found!\n"
+    "\nCreate a .spotify-cli.env file in your home directory with:\n"
+    "SPOTIFY_CLIENT_ID=your_client_id\n"
+    "SPOTIFY_CLIENT_SECRET=your_client_secret\n"
+    "SPOTIFY_REDIRECT_URI=http://localhost:8888/callback\n"
+    f"\nLocation: {ENV_PATH}\n"
+    "\nGet credentials at: https://developer.spotify.com/dashboard\n"
+)
+
+
+def write_lines(lines):
+    """Write a block of output lines to stdout with a single write and flush"""
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` requests per `per` seconds.
+
+    State lives in the process, so this only smooths bursts within one run
+    (e.g. paging a long playlist); separate CLI invocations are not throttled.
+    """
+
+    def __init__(self, rate: int = 10, per: float = 1.0):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.last_refill = time.monotonic()
+
+    def acquire(self):
+        """Block until a token is available and take it"""
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.last_refill) * self.rate / self.per)
+        self.last_refill = now
+        if self.tokens < 1:
+            time.sleep((1 - self.tokens) * self.per / self.rate)
+            self.tokens = 1
+            self.last_refill = time.monotonic()
+        self.tokens -= 1
+
+
+_throttling_classes = None
+
+
+def throttling_classes():
+    """Return (ThrottledRetry, ThrottledAdapter), defining them on first use.
+
+    The adapter takes a token from its limiter before the first attempt and
+    ThrottledRetry takes one before every retry, so urllib3 keeps owning the
+    retry policy. They are defined lazily because requests is imported lazily.
+    """
+    global _throttling_classes
+
+    if _throttling_classes is None:
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        class ThrottledRetry(Retry):
+            limiter = None
+
+            def new(self, **kw):
+                retry = super().new(**kw)
+                retry.limiter = self.limiter
+                return retry
+
+            def sleep(self, response=None):
+                super().sleep(response)
+                if self.limiter:
+                    self.limiter.acquire()
+
+        class ThrottledAdapter(HTTPAdapter):
+            def __init__(self, limiter: RateLimiter, **kwargs):
+                self.limiter = limiter
+                super().__init__(**kwargs)
+
+            def send(self, request, **kwargs):
+                self.limiter.acquire()
+                return super().send(request, **kwargs)
+
+        _throttling_classes = (ThrottledRetry, ThrottledAdapter)
+
+    return _throttling_classes
+
 
 class SpotifyCLI:
     def __init__(self):
         """Initialize Spotify client with OAuth authentication"""
-        # Store cache in home directory so it works from anywhere
-        cache_path = os.path.join(os.path.expanduser('~'), '.spotify-cli-cache')
-        
-        self.sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
+        import spotipy
+        from spotipy.oauth2 import SpotifyOAuth
+        import requests
+        import orjson
+
+        # Reuse one keep-alive connection pool for all API calls, throttled
+        # locally so bursts within a run don't run into 429 backoff
+        self._session = requests.Session()
+        self._limiter = RateLimiter()
+        ThrottledRetry, ThrottledAdapter = throttling_classes()
+        retry = ThrottledRetry(total=3, backoff_factor=0.2,
+                               status_forcelist=[429, 500, 502, 503, 504])
+        retry.limiter = self._limiter
+        self._session.mount('https://', ThrottledAdapter(
+            self._limiter,
+            pool_connections=4,
+            pool_maxsize=10,
+            max_retries=retry
+        ))
+
+        # Decode API responses with orjson instead of the stdlib json module
+        def use_orjson(response, *args, **kwargs):
+            response.json = lambda **kw: orjson.loads(response.content)
+
+        self._session.hooks['response'].append(use_orjson)
+
+        # A rejected token must not be reused by the next run's fast path
+        def forget_rejected_token(response, *args, **kwargs):
+            if response.status_code == 401:
+                try:
+                    os.remove(TOKEN_PATH)
+                except OSError:
+                    pass
+
+        self._session.hooks['response'].append(forget_rejected_token)
+
+        # (timestamp, response) of the last devices() call
+        self._devices_cache = (0.0, None)
+
+        # Fast path: reuse a still-valid token without touching SpotifyOAuth
+        token = self._load_token()
+        if token:
+            self.sp = spotipy.Spotify(auth=token['access_token'], requests_session=self._session)
+            return
+
+        auth_manager = SpotifyOAuth(
             client_id=os.getenv('SPOTIFY_CLIENT_ID'),
             client_secret=os.getenv('SPOTIFY_CLIENT_SECRET'),
             redirect_uri=os.getenv('SPOTIFY_REDIRECT_URI', 'http://localhost:8888/callback'),
-            scope='user-read-playback-state user-modify-playback-state user-read-currently-playing '
-                  'playlist-read-private playlist-modify-private playlist-modify-public '
-                  'user-library-read user-library-modify user-top-read',
-            cache_path=cache_path
-        ))
+            scope=SCOPE,
+            cache_path=CACHE_PATH
+        )
+        # Refreshes (or runs the login flow) and updates the Spotipy cache
+        auth_manager.get_access_token(as_dict=False)
+        self._save_token(auth_manager.cache_handler.get_cached_token())
+
+        self.sp = spotipy.Spotify(requests_session=self._session, auth_manager=auth_manager)
+
+    def _load_token(self) -> Optional[dict]:
+        """Return the persisted token if it is valid for at least another minute
+        and was issued to the configured client with the scopes we need"""
+        import json
+
+        try:
+            with open(TOKEN_PATH) as f:
+                token = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # Anything malformed just falls back to the OAuth flow
+        if not isinstance(token, dict) or not token.get('access_token'):
+            return None
+        try:
+            if time.time() >= token.get('expires_at', 0) - 60:
+                return None
+            if not set(SCOPE.split()) <= set(token.get('scope', '').split()):
+                return None
+        except (TypeError, AttributeError):
+            return None
+        if token.get('client_id') != os.getenv('SPOTIFY_CLIENT_ID'):
+            return None
+        return token
+
+    def _save_token(self, token_info: Optional[dict]):
+        """Atomically persist the access token so the next run can skip OAuth"""
+        import json
+        import tempfile
+
+        if not token_info:
+            return
+
+        token = {
+            'access_token': token_info['access_token'],
+            'expires_at': token_info['expires_at'],
+            'scope': token_info.get('scope', ''),
+            'client_id': os.getenv('SPOTIFY_CLIENT_ID'),
+        }
+        # The refresh token stays in Spotipy's cache only
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix='.spotify-cli-token.', suffix='.tmp',
+                                        dir=os.path.dirname(TOKEN_PATH))
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(token, f)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, TOKEN_PATH)
+        except (OSError, TypeError, ValueError):
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def _get_devices(self, ttl: float = 5) -> dict:
+        """Return the device list, reusing a response younger than ttl seconds"""
+        ts, devices = self._devices_cache
+        if devices is None or time.time() - ts >= ttl:
+            devices = self.sp.devices()
+            self._devices_cache = (time.time(), devices)
+        return devices
 
     def check_active_device(self, auto_open: bool = False) -> bool:
         """Check if there's an active device, offer to open web player if not"""
-        devices = self.sp.devices()
+        devices = self._get_devices()
         
         if not devices['devices']:
-            print("❌ No Spotify devices found!")
-            print("\n💡 To use Spotify CLI, you need to:")
-            print("   1. Open Spotify Desktop App, or")
-            print("   2. Open Spotify on your phone, or")
-            print("   3. Open Spotify Web Player")
+            sys.stdout.write(_NO_DEVICE_MSG)
             
             if auto_open:
                 response = input("\n🌐 Would you like to open Spotify Web Player? (y/n): ")
                 if response.lower() in ['y', 'yes']:
+                    import webbrowser
                     webbrowser.open('https://open.spotify.com')
                     print("\n✅ Web player opened! Wait a moment for it to load, then try your command again.")
             else:
@@ -57,9 +260,7 @@ class SpotifyCLI:
             return False
         
         # Check if any device is active
-        active_devices = [d for d in devices['devices'] if d['is_active']]
-        
-        if not active_devices:
+        if not any(d['is_active'] for d in devices['devices']):
             print("⚠️  Spotify devices found but none are active:")
             for device in devices['devices']:
                 print(f"   • {device['name']} ({device['type']})")
@@ -89,19 +290,22 @@ class SpotifyCLI:
         if current.get('device'):
             print(f"   Device: {current['device']['name']}")
 
-    def play(self, uri: Optional[str] = None, auto_open: bool = False):
+    def play(self, uri: Optional[str] = None, auto_open: bool = False, check_device: bool = False):
         """Resume playback or play specific URI"""
-        if not self.check_active_device(auto_open):
+        from spotipy import SpotifyException
+
+        if check_device and not self.check_active_device(auto_open):
             return
-            
+
+        # Try playback straight away; only list devices if Spotify reports none active
         try:
-            if uri:
-                self.sp.start_playback(uris=[uri])
-                print("▶️  Playing track")
-            else:
-                self.sp.start_playback()
-                print("▶️  Playback resumed")
+            self.sp.start_playback(uris=[uri] if uri else None)
+            print("▶️  Playing track" if uri else "▶️  Playback resumed")
         except Exception as e:
+            no_active_device = (isinstance(e, SpotifyException) and e.http_status == 404
+                                and e.reason == 'NO_ACTIVE_DEVICE')
+            if no_active_device and not self.check_active_device(auto_open):
+                return
             print(f"❌ Error: {e}")
 
     def pause(self):
@@ -131,6 +335,7 @@ class SpotifyCLI:
     def search(self, query: str, type: str = 'track', limit: int = 10):
         """Search for tracks, artists, albums, or playlists"""
         results = self.sp.search(q=query, type=type, limit=limit)
+        lines = []
         
         if type == 'track':
             tracks = results['tracks']['items']
@@ -138,11 +343,11 @@ class SpotifyCLI:
                 print("❌ No tracks found")
                 return
             
-            print(f"\n🔍 Search results for '{query}':\n")
+            lines.append(f"\n🔍 Search results for '{query}':\n")
             for i, track in enumerate(tracks, 1):
-                artists = ', '.join([artist['name'] for artist in track['artists']])
-                print(f"{i}. {track['name']} - {artists}")
-                print(f"   URI: {track['uri']}\n")
+                artists = ', '.join(artist['name'] for artist in track['artists'])
+                lines.append(f"{i}. {track['name']} - {artists}")
+                lines.append(f"   URI: {track['uri']}\n")
         
         elif type == 'artist':
             artists = results['artists']['items']
@@ -150,11 +355,11 @@ class SpotifyCLI:
                 print("❌ No artists found")
                 return
             
-            print(f"\n🔍 Artist results for '{query}':\n")
+            lines.append(f"\n🔍 Artist results for '{query}':\n")
             for i, artist in enumerate(artists, 1):
-                print(f"{i}. {artist['name']}")
-                print(f"   Followers: {artist['followers']['total']:,}")
-                print(f"   URI: {artist['uri']}\n")
+                lines.append(f"{i}. {artist['name']}")
+                lines.append(f"   Followers: {artist['followers']['total']:,}")
+                lines.append(f"   URI: {artist['uri']}\n")
 
         elif type == 'album':
             albums = results['albums']['items']
@@ -162,33 +367,44 @@ class SpotifyCLI:
                 print("❌ No albums found")
                 return
             
-            print(f"\n🔍 Album results for '{query}':\n")
+            lines.append(f"\n🔍 Album results for '{query}':\n")
             for i, album in enumerate(albums, 1):
-                artists = ', '.join([artist['name'] for artist in album['artists']])
-                print(f"{i}. {album['name']} - {artists}")
-                print(f"   Release: {album['release_date']}")
-                print(f"   URI: {album['uri']}\n")
+                artists = ', '.join(artist['name'] for artist in album['artists'])
+                lines.append(f"{i}. {album['name']} - {artists}")
+                lines.append(f"   Release: {album['release_date']}")
+                lines.append(f"   URI: {album['uri']}\n")
+
+        if lines:
+            write_lines(lines)
 
     def my_playlists(self, limit: int = 20):
         """List user's playlists"""
         playlists = self.sp.current_user_playlists(limit=limit)
         
-        print("\n📚 Your Playlists:\n")
+        lines = ["\n📚 Your Playlists:\n"]
         for i, playlist in enumerate(playlists['items'], 1):
-            print(f"{i}. {playlist['name']}")
-            print(f"   Tracks: {playlist['tracks']['total']}")
-            print(f"   URI: {playlist['uri']}\n")
+            lines.append(f"{i}. {playlist['name']}")
+            lines.append(f"   Tracks: {playlist['tracks']['total']}")
+            lines.append(f"   URI: {playlist['uri']}\n")
+        write_lines(lines)
 
     def playlist_tracks(self, playlist_uri: str):
         """Show tracks in a playlist"""
-        playlist = self.sp.playlist(playlist_uri)
+        playlist = self.sp.playlist(playlist_uri, fields='name')
         
-        print(f"\n📚 {playlist['name']}\n")
-        for i, item in enumerate(playlist['tracks']['items'], 1):
-            track = item['track']
-            if track:
-                artists = ', '.join([artist['name'] for artist in track['artists']])
-                print(f"{i}. {track['name']} - {artists}")
+        lines = [f"\n📚 {playlist['name']}\n"]
+        i = 0
+        page = self.sp.playlist_items(playlist_uri, fields='items(track(name,artists(name))),next',
+                                      limit=100, additional_types=('track',))
+        while page:
+            for item in page['items']:
+                i += 1
+                track = item['track']
+                if track:
+                    artists = ', '.join(artist['name'] for artist in track['artists'])
+                    lines.append(f"{i}. {track['name']} - {artists}")
+            page = self.sp.next(page) if page.get('next') else None
+        write_lines(lines)
 
     def volume(self, level: int):
         """Set volume (0-100)"""
@@ -201,17 +417,18 @@ class SpotifyCLI:
 
     def devices(self):
         """List available devices"""
-        devices = self.sp.devices()
+        devices = self._get_devices()
         
         if not devices['devices']:
             print("❌ No devices found")
             return
         
-        print("\n📱 Available Devices:\n")
+        lines = ["\n📱 Available Devices:\n"]
         for device in devices['devices']:
             active = "✓" if device['is_active'] else " "
-            print(f"[{active}] {device['name']} ({device['type']})")
-            print(f"    ID: {device['id']}\n")
+            lines.append(f"[{active}] {device['name']} ({device['type']})")
+            lines.append(f"    ID: {device['id']}\n")
+        write_lines(lines)
 
     def top_tracks(self, limit: int = 10, time_range: str = 'medium_term'):
         """Show user's top tracks"""
@@ -223,98 +440,96 @@ class SpotifyCLI:
             'long_term': 'All Time'
         }
         
-        print(f"\n🌟 Your Top Tracks ({range_names.get(time_range, time_range)}):\n")
+        lines = [f"\n🌟 Your Top Tracks ({range_names.get(time_range, time_range)}):\n"]
         for i, track in enumerate(results['items'], 1):
-            artists = ', '.join([artist['name'] for artist in track['artists']])
-            print(f"{i}. {track['name']} - {artists}")
+            artists = ', '.join(artist['name'] for artist in track['artists'])
+            lines.append(f"{i}. {track['name']} - {artists}")
+        write_lines(lines)
 
 
-def main():
+def build_parser() -> argparse.ArgumentParser:
+    """Build the command-line parser"""
     parser = argparse.ArgumentParser(description='Spotify CLI - Control Spotify from the command line')
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
 
     # Now playing
-    subparsers.add_parser('now', help='Show current playback')
+    now_parser = subparsers.add_parser('now', help='Show current playback')
+    now_parser.set_defaults(func=lambda cli, args: cli.current_playback())
     
     # Playback controls
     play_parser = subparsers.add_parser('play', help='Resume playback or play URI')
     play_parser.add_argument('uri', nargs='?', help='Spotify URI to play')
     play_parser.add_argument('--open', action='store_true', help='Open web player if no device found')
+    play_parser.add_argument('--check-device', action='store_true',
+                             help='Verify an active device exists before starting playback')
+    play_parser.set_defaults(func=lambda cli, args: cli.play(args.uri, args.open, args.check_device))
     
-    subparsers.add_parser('pause', help='Pause playback')
-    subparsers.add_parser('next', help='Next track')
-    subparsers.add_parser('prev', help='Previous track')
+    pause_parser = subparsers.add_parser('pause', help='Pause playback')
+    pause_parser.set_defaults(func=lambda cli, args: cli.pause())
+    next_parser = subparsers.add_parser('next', help='Next track')
+    next_parser.set_defaults(func=lambda cli, args: cli.next_track())
+    prev_parser = subparsers.add_parser('prev', help='Previous track')
+    prev_parser.set_defaults(func=lambda cli, args: cli.previous_track())
     
     # Volume
     volume_parser = subparsers.add_parser('volume', help='Set volume (0-100)')
     volume_parser.add_argument('level', type=int, help='Volume level')
+    volume_parser.set_defaults(func=lambda cli, args: cli.volume(args.level))
     
     # Search
     search_parser = subparsers.add_parser('search', help='Search Spotify')
     search_parser.add_argument('query', help='Search query')
     search_parser.add_argument('--type', choices=['track', 'artist', 'album'], default='track', help='Search type')
     search_parser.add_argument('--limit', type=int, default=10, help='Number of results')
+    search_parser.set_defaults(func=lambda cli, args: cli.search(args.query, args.type, args.limit))
     
     # Playlists
     playlists_parser = subparsers.add_parser('playlists', help='List your playlists')
     playlists_parser.add_argument('--limit', type=int, default=20, help='Number of playlists')
+    playlists_parser.set_defaults(func=lambda cli, args: cli.my_playlists(args.limit))
     
     playlist_parser = subparsers.add_parser('playlist', help='Show playlist tracks')
     playlist_parser.add_argument('uri', help='Playlist URI')
+    playlist_parser.set_defaults(func=lambda cli, args: cli.playlist_tracks(args.uri))
     
     # Devices
-    subparsers.add_parser('devices', help='List available devices')
+    devices_parser = subparsers.add_parser('devices', help='List available devices')
+    devices_parser.set_defaults(func=lambda cli, args: cli.devices())
     
     # Top tracks
     top_parser = subparsers.add_parser('top', help='Show top tracks')
     top_parser.add_argument('--limit', type=int, default=10, help='Number of tracks')
     top_parser.add_argument('--range', choices=['short', 'medium', 'long'], default='medium', 
                            help='Time range: short (4 weeks), medium (6 months), long (all time)')
+    top_parser.set_defaults(func=lambda cli, args: cli.top_tracks(args.limit, f"{args.range}_term"))
+
+    return parser
+
 
+def main():
+    parser = build_parser()
     args = parser.parse_args()
 
     if not args.command:
         parser.print_help()
         return
 
+    # Load environment variables
+    # Try to load from current directory first, then from home directory
+    from dotenv import load_dotenv
+    if os.path.exists('.env'):
+        load_dotenv()
+    else:
+        load_dotenv(ENV_PATH)
+
     # Check for credentials
     if not os.getenv('SPOTIFY_CLIENT_ID') or not os.getenv('SPOTIFY_CLIENT_SECRET'):
-        print("❌ Error: Spotify credentials not found!")
-        print("\nCreate a .spotify-cli.env file in your home directory with:")
-        print("SPOTIFY_CLIENT_ID=your_client_id")
-        print("SPOTIFY_CLIENT_SECRET=your_client_secret")
-        print("SPOTIFY_REDIRECT_URI=http://localhost:8888/callback")
-        print(f"\nLocation: {os.path.join(os.path.expanduser('~'), '.spotify-cli.env')}")
-        print("\nGet credentials at: https://developer.spotify.com/dashboard")
+        sys.stdout.write(_MISSING_CREDENTIALS_MSG)
         sys.exit(1)
 
     try:
         cli = SpotifyCLI()
-        
-        if args.command == 'now':
-            cli.current_playback()
-        elif args.command == 'play':
-            cli.play(args.uri, args.open)
-        elif args.command == 'pause':
-            cli.pause()
-        elif args.command == 'next':
-            cli.next_track()
-        elif args.command == 'prev':
-            cli.previous_track()
-        elif args.command == 'volume':
-            cli.volume(args.level)
-        elif args.command == 'search':
-            cli.search(args.query, args.type, args.limit)
-        elif args.command == 'playlists':
-            cli.my_playlists(args.limit)
-        elif args.command == 'playlist':
-            cli.playlist_tracks(args.uri)
-        elif args.command == 'devices':
-            cli.devices()
-        elif args.command == 'top':
-            time_range = f"{args.range}_term"
-            cli.top_tracks(args.limit, time_range)
-            
+        args.func(cli, args)
     except Exception as e:
         print(f"❌ Error: {e}")
         sys.exit(1)